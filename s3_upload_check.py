@@ -1,8 +1,12 @@
 """s3_upload_check.py
 
-Simple script to upload a file to S3 and verify it exists.
+Simple script to upload a file to S3 and optionally verify it exists.
 Usage examples are in README.md.
 
+A successful upload_file call already means S3 accepted every part (the
+transfer manager raises on any failed part), so the extra head_object
+round-trip is only made when --verify is given.
+
 This script expects AWS credentials to be available via environment variables
 (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY) or an AWS named profile.
 """
@@ -10,18 +14,42 @@ This script expects AWS credentials to be available via environment variables
 from __future__ import annotations
 
 import argparse
+import functools
 import logging
+import mimetypes
 import os
 import sys
 from typing import Optional
 
 import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
+# The data dumps we upload are hundreds of MB, so use bigger parts and more
+# parallel connections than boto3's defaults (8 MB parts, 10 threads).
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=64 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True,
+)
+
+
+@functools.lru_cache(maxsize=8)
+def _s3_client(region: Optional[str], profile: Optional[str]):
+    """Return an S3 client for (region, profile), created once per process.
+
+    Building a Session loads botocore's service models, which is slow, so
+    repeated calls reuse the same client.
+    """
+    session = boto3.Session(profile_name=profile) if profile else boto3.Session()
+    return session.client("s3", region_name=region)
+
 
 def upload_file(bucket: str, key: str, filename: str, region: Optional[str] = None, profile: Optional[str] = None) -> bool:
     """Upload a local file to S3.
@@ -32,22 +60,29 @@ def upload_file(bucket: str, key: str, filename: str, region: Optional[str] = No
         logger.error("Local file '%s' does not exist.", filename)
         return False
 
-    session = boto3.Session(profile_name=profile) if profile else boto3.Session()
-    s3 = session.client("s3", region_name=region)
+    s3 = _s3_client(region, profile)
+
+    extra_args = {}
+    # For compressed files like data.csv.gz the type describes the payload
+    # and the encoding the compression, so both must be set.
+    content_type, encoding = mimetypes.guess_type(filename)
+    if content_type:
+        extra_args["ContentType"] = content_type
+    if encoding:
+        extra_args["ContentEncoding"] = encoding
 
     try:
-        s3.upload_file(filename, bucket, key)
+        s3.upload_file(filename, bucket, key, ExtraArgs=extra_args or None, Config=TRANSFER_CONFIG)
         logger.info("Uploaded '%s' to 's3://%s/%s'", filename, bucket, key)
         return True
-    except ClientError as e:
+    except (ClientError, S3UploadFailedError) as e:
         logger.error("Failed to upload file: %s", e)
         return False
 
 
 def object_exists(bucket: str, key: str, region: Optional[str] = None, profile: Optional[str] = None) -> bool:
     """Return True if the object exists in S3, False otherwise."""
-    session = boto3.Session(profile_name=profile) if profile else boto3.Session()
-    s3 = session.client("s3", region_name=region)
+    s3 = _s3_client(region, profile)
 
     try:
         s3.head_object(Bucket=bucket, Key=key)
@@ -63,12 +98,13 @@ def object_exists(bucket: str, key: str, region: Optional[str] = None, profile:
 
 
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
-    p = argparse.ArgumentParser(description="Upload file to S3 and verify it exists.")
+    p = argparse.ArgumentParser(description="Upload file to S3 and optionally verify it exists (--verify).")
     p.add_argument("--bucket", required=True, help="S3 bucket name")
     p.add_argument("--key", required=True, help="S3 object key (path in bucket)")
     p.add_argument("--file", required=True, help="Local file path to upload")
     p.add_argument("--region", help="AWS region (optional)")
     p.add_argument("--profile", help="AWS named profile to use (optional)")
+    p.add_argument("--verify", action="store_true", help="Confirm the object exists with a head_object call after uploading")
     return p.parse_args(argv)
 
 
@@ -80,6 +116,9 @@ def main(argv: Optional[list[str]] = None) -> int:
         logger.error("Upload failed; exiting with code 2")
         return 2
 
+    if not args.verify:
+        return 0
+
     exists = object_exists(args.bucket, args.key, region=args.region, profile=args.profile)
     if exists:
         logger.info("Verified: object exists in S3.")
@@ -17,22 +17,39 @@ Options:
  - --timestamp-col: name of timestamp column (default: timestamp)
  - --rating-col: name of rating value column (default: rating)
  - --keep-order: write rows in the same order as their newest timestamp occurrences (default: arbitrary) 
-
-Notes:
-- For very large files that don't fit in memory, consider external sort
-  by (userId,movieId) and then keeping the last entry per group.
+ - --pandas: deduplicate with a vectorized pandas sort + drop_duplicates
+   instead of the row-by-row scan. The file is parsed with pyarrow's CSV
+   reader. Only the four known columns are kept and ids/timestamps must be
+   numeric.
+ - --external: for files that don't fit in memory, sort the input with
+   coreutils `sort` by (userId,movieId,timestamp) and keep the last row of
+   each (userId,movieId) group while streaming the sorted output. Memory use
+   is independent of file size. Requires GNU sort and an input without
+   quoted fields; output is ordered by (userId,movieId).
 """
 
 from __future__ import annotations
 
 import argparse
 import csv
+import io
 import os
+import subprocess
 import sys
-from typing import Dict, Tuple
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
 
-# Progress bar utility used by multiple scripts
-from progress import ProgressBar, wrap_iter
+# Progress bar utility and output buffer size shared by the scripts
+from progress import WRITE_BUFFER, ProgressBar, wrap_iter
+
+# Memory buffer and thread count handed to `sort` in --external mode.
+SORT_BUFFER = "1G"
+SORT_PARALLEL = 4
 
 
 def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
@@ -44,100 +61,293 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser.add_argument("--timestamp-col", default="timestamp", help="Column name for timestamp (default: timestamp)")
     parser.add_argument("--rating-col", default="rating", help="Column name for rating value (default: rating)")
     parser.add_argument("--keep-order", action="store_true", help="Write rows in the same order as their newest timestamp occurrences (default: arbitrary)")
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument("--pandas", action="store_true", help="Use the vectorized pandas implementation (numeric id/timestamp columns only)")
+    engine.add_argument("--external", action="store_true", help="Use an external `sort` so memory does not grow with the input (output ordered by user,item)")
     return parser.parse_args(argv)
 
 
+# Results of the slow to_int_safe fallback, keyed by the raw string. Bounded
+# so a file full of distinct garbage values can't grow it without limit.
+_TS_FALLBACK_CACHE: Dict[str, int] = {}
+_TS_FALLBACK_CACHE_MAX = 1 << 16
+
+# Timestamps are stored in an int64 array, so anything outside this range is
+# treated as garbled.
+_TS_MIN = -(1 << 63)
+_TS_MAX = (1 << 63) - 1
+
+
 def to_int_safe(value: str) -> int:
     """Try to convert a timestamp-like string to int; on failure, return 0.
 
     We return 0 as a fallback so that missing/garbled timestamps are treated as
-    very old.
+    very old. Values outside the int64 range count as garbled too.
+
+    Plain integers go straight through int(), which is cheaper than a cache
+    lookup. Values that need the float/error fallback are memoized, so a
+    repeated bad value is parsed and reported only once.
     """
     try:
-        return int(value)
+        result = int(value)
+        if _TS_MIN <= result <= _TS_MAX:
+            return result
     except Exception:
-        try:
-            # maybe a float-like value
-            return int(float(value))
-        except Exception:
-            # Log the bad value and return 0
-            sys.stderr.write(f"Warning: could not convert timestamp value '{value}' to int; using 0\n")
-            return 0
+        pass
+
+    cached = _TS_FALLBACK_CACHE.get(value)
+    if cached is not None:
+        return cached
+
+    try:
+        # maybe a float-like value
+        result = int(float(value))
+        if not _TS_MIN <= result <= _TS_MAX:
+            raise OverflowError(value)
+    except Exception:
+        # Log the bad value and return 0
+        sys.stderr.write(f"Warning: could not convert timestamp value '{value}' to int; using 0\n")
+        result = 0
+
+    if len(_TS_FALLBACK_CACHE) >= _TS_FALLBACK_CACHE_MAX:
+        _TS_FALLBACK_CACHE.clear()
+    _TS_FALLBACK_CACHE[value] = result
+    return result
+
+
+def _drain_rows(rows: List[List[str]]) -> Iterator[List[str]]:
+    """Yield the stored rows, removing each one from `rows` as it goes."""
+    while rows:
+        yield rows.pop()
 
 
 def dedup_ratings(inpath: str, outpath: str, user_col: str, item_col: str, ts_col: str, rating_col: str, keep_order: bool = False) -> Tuple[int, int]:
     """Return (kept_count, total_rows).
 
     This reads the whole input and keeps in memory a mapping from (user,item)
-    to (timestamp, row_dict). If a duplicate is found with a newer timestamp,
-    it replaces the stored row.
+    to a slot number, plus two parallel columns indexed by slot: the newest
+    timestamp (a packed int64 array) and the row it came from. If a duplicate
+    is found with a newer timestamp, it replaces the row in that slot. Rows
+    are kept as the plain lists produced by csv.reader; column positions are
+    resolved once from the header.
     """
     if not os.path.exists(inpath):
         sys.stderr.write(f"Error: input file does not exist: {inpath}\n")
         raise FileNotFoundError(inpath)
 
-    best: Dict[Tuple[str, str], Tuple[int, dict]] = {}
+    slots: Dict[Tuple[str, str], int] = {}
+    timestamps = array("q")
+    rows: List[List[str]] = []
     total = 0
 
     with open(inpath, newline="", encoding="utf-8") as fh:
-        reader = csv.DictReader(fh)
-        if reader.fieldnames is None:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if header is None:
             raise ValueError("Input CSV has no header")
 
         # It's not strictly necessary to check for the rating column, but we do it because there's no point to the exercise if there's no rating data.
-        if user_col not in reader.fieldnames or item_col not in reader.fieldnames or ts_col not in reader.fieldnames or rating_col not in reader.fieldnames:
-            raise ValueError(f"Missing expected columns. Available: {reader.fieldnames}")
+        if user_col not in header or item_col not in header or ts_col not in header or rating_col not in header:
+            raise ValueError(f"Missing expected columns. Available: {header}")
+
+        u_i = header.index(user_col)
+        i_i = header.index(item_col)
+        t_i = header.index(ts_col)
+        r_i = header.index(rating_col)
+        # rows too short to reach every column are skipped with a warning
+        last = max(u_i, i_i, t_i, r_i)
 
         # Wrap the CSV reader so we show progress while scanning rows. Use a
         # context manager to ensure the final bar is drawn.
+        # Bind the per-row callables to locals once; local loads are cheaper
+        # than global and attribute lookups in this loop.
+        intern = sys.intern
+        parse_ts = to_int_safe
+        slot_get = slots.get
+        rows_append = rows.append
+        ts_append = timestamps.append
         with ProgressBar(prefix="Reading") as pbr:
             for row in wrap_iter(reader, progress=pbr):
+                if not row:
+                    continue  # blank line
+                if len(row) <= last:
+                    sys.stderr.write(f"Warning: skipping row with {len(row)} of {len(header)} fields: {row}\n")
+                    continue
                 total += 1
-                user = row.get(user_col, "")
-                item = row.get(item_col, "")
-                ts_raw = row.get(ts_col, "")
-                ts = to_int_safe(ts_raw)
-
+                ts = parse_ts(row[t_i])
+                # ids and ratings repeat across millions of rows; interning
+                # them means every stored row and key shares one string per
+                # distinct value instead of holding its own copy.
+                user = row[u_i] = intern(row[u_i])
+                item = row[i_i] = intern(row[i_i])
+                row[r_i] = intern(row[r_i])
                 key = (user, item)
-                entry = best.get(key)
-                if entry is None:
-                    best[key] = (ts, row)
-                else:
-                    existing_ts, _ = entry
-                    # keep the row with the greater (newer) timestamp
-                    if ts >= existing_ts:
-                        best[key] = (ts, row)
+                j = slot_get(key)
+                if j is None:
+                    slots[key] = len(rows)
+                    rows_append(row)
+                    ts_append(ts)
+                # keep the row with the greater (newer) timestamp
+                elif ts >= timestamps[j]:
+                    rows[j] = row
+                    timestamps[j] = ts
+
+    # The keys are only needed while reading; free them before writing.
+    del slots
 
     # prepare to write
     os.makedirs(os.path.dirname(outpath), exist_ok=True)
-    # choose the header from the original input; they are the same across rows
-    header = None
-    # best.values() is (ts,row)
-    if best:
-        header = list(next(iter(best.values()))[1].keys())
-    else:
-        # no rows -> try to read header from input
-        with open(inpath, newline="", encoding="utf-8") as fh:
-            reader = csv.DictReader(fh)
-            header = reader.fieldnames or []
-
-    # Optionally order rows by their stored timestamp (newest first) or
-    # arbitrary (dictionary order). If keep_order is True, order by timestamp
-    # ascending of newest occurrence so that final file is reproducible.
-    items = list(best.items())  # list of ((user,item),(ts,row))
-    if keep_order:
-        items.sort(key=lambda it: it[1][0])
 
-    with open(outpath, "w", newline="", encoding="utf-8") as outfh:
-        writer = csv.DictWriter(outfh, fieldnames=header)
-        writer.writeheader()
+    kept = len(rows)
+
+    with open(outpath, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as outfh:
+        writer = csv.writer(outfh)
+        writer.writerow(header)
+        # Optionally order rows by their stored timestamp (newest first) or
+        # arbitrary (slot order). If keep_order is True, order by timestamp
+        # ascending of newest occurrence so that final file is reproducible;
+        # the timestamp column is argsorted in place as a NumPy view, so no
+        # per-row Python sort keys are built. Otherwise drain the rows as we
+        # write so they are released as soon as they are written.
+        if keep_order:
+            order = np.argsort(np.frombuffer(timestamps, dtype=np.int64), kind="stable")
+            out_rows = (rows[j] for j in order)
+        else:
+            out_rows = _drain_rows(rows)
         # Show progress during the write phase; we know the total number of
         # items to write so show a percentage bar.
-        with ProgressBar(total=len(items), prefix="Writing") as pbw:
-            for _, (ts, row) in wrap_iter(items, progress=pbw):
-                writer.writerow(row)
+        with ProgressBar(total=kept, prefix="Writing") as pbw:
+            writer.writerows(wrap_iter(out_rows, progress=pbw))
+
+    return kept, total
+
+
+def dedup_ratings_pandas(inpath: str, outpath: str, user_col: str, item_col: str, ts_col: str, rating_col: str, keep_order: bool = False) -> Tuple[int, int]:
+    """Return (kept_count, total_rows), deduplicating with pandas.
+
+    The input is loaded into typed columns and the newest row per (user,item)
+    is selected by a stable sort on the timestamp followed by
+    drop_duplicates(keep="last"). Stability means a later row wins over an
+    earlier one with the same timestamp, matching dedup_ratings. The result
+    is always in timestamp order, so keep_order needs no extra work.
+    """
+    if not os.path.exists(inpath):
+        sys.stderr.write(f"Error: input file does not exist: {inpath}\n")
+        raise FileNotFoundError(inpath)
+
+    # pyarrow returns include_columns in the order given, so list them in
+    # header order to keep the output layout.
+    with open(inpath, newline="", encoding="utf-8") as fh:
+        header = next(csv.reader(fh), None)
+    if header is None:
+        raise ValueError("Input CSV has no header")
+    if user_col not in header or item_col not in header or ts_col not in header or rating_col not in header:
+        raise ValueError(f"Missing expected columns. Available: {header}")
+    wanted = {user_col, item_col, ts_col, rating_col}
+    columns = [c for c in header if c in wanted]
+
+    # Parse straight into the target Arrow types rather than through pandas'
+    # pyarrow engine, which reads numbers as double and casts unchecked.
+    # This way a non-integer id or an out-of-range timestamp raises.
+    table = pacsv.read_csv(
+        inpath,
+        convert_options=pacsv.ConvertOptions(
+            column_types={user_col: pa.int32(), item_col: pa.int32(), ts_col: pa.int64(), rating_col: pa.float32()},
+            include_columns=columns,
+        ),
+    )
+    df = table.to_pandas()
+    total = len(df)
+
+    df = df.sort_values(ts_col, kind="stable").drop_duplicates([user_col, item_col], keep="last")
+
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
+    with open(outpath, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as outfh:
+        df.to_csv(outfh, index=False, lineterminator="\r\n")
+
+    return len(df), total
+
+
+def dedup_ratings_external(inpath: str, outpath: str, user_col: str, item_col: str, ts_col: str, rating_col: str, keep_order: bool = False) -> Tuple[int, int]:
+    """Return (kept_count, total_rows), deduplicating via an external sort.
+
+    The body of the input (everything after the header) is piped through
+    `sort -s -t, -k<user> -k<item> -k<ts>g`, which groups each (user,item)
+    pair together with its rows in ascending timestamp order. The general
+    numeric key (g) reads float-like values such as 5.0e2 the same way
+    to_int_safe does; non-numeric timestamps sort before all numbers rather
+    than exactly as 0. Because the sort is stable, the last row of each group
+    is the one dedup_ratings would keep, so we only need to remember the
+    previous row while streaming. Blank lines are skipped. Fields are split
+    on every comma, so quoted fields containing commas are not supported.
+    """
+    if not os.path.exists(inpath):
+        sys.stderr.write(f"Error: input file does not exist: {inpath}\n")
+        raise FileNotFoundError(inpath)
+    if keep_order:
+        raise ValueError("--keep-order is not supported with --external")
+
+    # Unbuffered so that after reading the header the OS file offset sits at
+    # the first data row; `sort` inherits the descriptor and reads from there.
+    with open(inpath, "rb", buffering=0) as raw:
+        header_line = raw.readline().decode("utf-8")
+        header = next(csv.reader([header_line]), None)
+        if header is None:
+            raise ValueError("Input CSV has no header")
+
+        if user_col not in header or item_col not in header or ts_col not in header or rating_col not in header:
+            raise ValueError(f"Missing expected columns. Available: {header}")
+
+        u_i = header.index(user_col)
+        i_i = header.index(item_col)
+        t_i = header.index(ts_col)
+        last = max(u_i, i_i, t_i, header.index(rating_col))
+        # sort numbers fields from 1
+        u_f, i_f, t_f = u_i + 1, i_i + 1, t_i + 1
+
+        cmd = [
+            "sort", "-s", "-t,", f"-S{SORT_BUFFER}", f"--parallel={SORT_PARALLEL}",
+            f"-k{u_f},{u_f}", f"-k{i_f},{i_f}", f"-k{t_f},{t_f}g",
+        ]
+        # The C locale makes sort compare bytes, which is both faster and
+        # independent of the user's environment.
+        env = dict(os.environ, LC_ALL="C")
+        proc = subprocess.Popen(cmd, stdin=raw, stdout=subprocess.PIPE, env=env)
+
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
+
+    kept = 0
+    total = 0
+    with io.TextIOWrapper(proc.stdout, encoding="utf-8", newline="") as sorted_fh, \
+         open(outpath, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as outfh:
+        writer = csv.writer(outfh)
+        writer.writerow(header)
+
+        prev_row = None
+        prev_key = None
+        writerow = writer.writerow
+        with ProgressBar(prefix="Reducing") as pbr:
+            for row in wrap_iter(csv.reader(sorted_fh), progress=pbr):
+                if not row:
+                    continue  # blank line; sort moves these to the front
+                if len(row) <= last:
+                    sys.stderr.write(f"Warning: skipping row with {len(row)} of {len(header)} fields: {row}\n")
+                    continue
+                total += 1
+                key = (row[u_i], row[i_i])
+                if prev_key is not None and key != prev_key:
+                    writerow(prev_row)
+                    kept += 1
+                prev_key = key
+                prev_row = row
+        if prev_row is not None:
+            writer.writerow(prev_row)
+            kept += 1
+
+    rc = proc.wait()
+    if rc != 0:
+        raise RuntimeError(f"sort exited with status {rc}")
 
-    kept = len(best)
     return kept, total
 
 
@@ -145,7 +355,13 @@ def main(argv: list[str] | None = None) -> int:
     args = parse_args(argv)
 
     try:
-        kept, total = dedup_ratings(args.input, args.output, args.user_col, args.item_col, args.rating_col, args.timestamp_col, args.keep_order)
+        if args.pandas:
+            dedup = dedup_ratings_pandas
+        elif args.external:
+            dedup = dedup_ratings_external
+        else:
+            dedup = dedup_ratings
+        kept, total = dedup(args.input, args.output, args.user_col, args.item_col, args.timestamp_col, args.rating_col, args.keep_order)
         print(f"Processed {total} rows; kept {kept} unique (userId,movieId) pairs")
         return 0
     except Exception as e:
@@ -3,9 +3,23 @@
 Remove ratings from users who have fewer than a configurable threshold of
 ratings. Default threshold is 10.
 
-Two-pass approach:
+Two-pass approach (--keep-order):
  - Pass 1: count ratings per userId (memory: one counter per unique user)
- - Pass 2: write rows where user's count >= threshold
+ - Pass 2: copy the raw lines whose user's count >= threshold, unchanged.
+   Records are found by splitting on newlines; a line with an unbalanced
+   quote is joined with the following lines, so quoted fields may span
+   lines. An input that ends inside an open quote is rejected.
+
+ User ids that are all integers in [0, MAX_DENSE_USER_ID) (as in MovieLens)
+ are counted with np.bincount and looked up in a dense boolean array.
+ Negative or very large integer ids fall back to np.unique counts and a set
+ lookup; non-integer ids are counted and compared as strings.
+
+Single-pass approach (default):
+ - Rows of a user are buffered until the user reaches the threshold, then
+   the buffer is flushed and later rows are written straight through. Rows
+   of users that never reach the threshold are dropped at EOF. This reads
+   the file once but rows come out grouped by when each user qualified.
 
 Usage:
     python scripts/filter_low_activity_users.py \
@@ -16,7 +30,8 @@ Usage:
 Options:
  - --user-col: name of user id column (default: userId)
  - --threshold: min number of ratings to keep (default: 10)
- - --keep-order: preserve original file order in output (default: True)
+ - --keep-order: preserve original file order in output (default: False).
+   Any user id works; integer ids in [0, MAX_DENSE_USER_ID) are fastest.
 
 """
 
@@ -25,10 +40,26 @@ from __future__ import annotations
 import argparse
 import collections
 import csv
+import io
 import os
 import sys
-from typing import Dict
-from progress import ProgressBar, wrap_iter
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from progress import WRITE_BUFFER, ProgressBar, wrap_iter
+
+# Rows per pandas chunk when counting users in the two-pass (--keep-order) path.
+CHUNK_ROWS = 1_000_000
+
+# Integer user ids below this use a dense counts array / keep mask (one slot
+# per possible id, 8 MiB of counts per million ids). Larger ids fall back to
+# sparse counting so one huge id can't allocate gigabytes.
+MAX_DENSE_USER_ID = 1 << 24
+
+# Bytes read at a time by the second (filtering) pass of the two-pass path.
+READ_CHUNK = 4 << 20
 
 
 def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
@@ -37,49 +68,226 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     p.add_argument("--output", required=True, help="Path to write filtered CSV")
     p.add_argument("--user-col", default="userId", help="Column name for user id (default: userId)")
     p.add_argument("--threshold", type=int, default=20, help="Minimum number of ratings required to keep a user's ratings (default: 30)")
-    p.add_argument("--keep-order", action="store_true", help="Preserve original order in output (default: write in streaming order)")
+    p.add_argument("--keep-order", action="store_true", help="Preserve original order in output using two passes over the input (default: single pass, grouped output order). Integer user ids below 2**24 use a fast dense lookup; other ids fall back to a set")
     return p.parse_args(argv)
 
 
-def count_users(inpath: str, user_col: str) -> Dict[str, int]:
+def _count_int_users(inpath: str, user_col: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Count integer user ids; raises ValueError if an id isn't an integer.
+
+    An id only counts as an integer when it is written canonically, i.e.
+    str(int(s)) == s, so that pass 2's int(field) lookups see the same ids:
+    "1.0", " 1" or "01" send the whole file to the string counter instead.
+    Counts go into a dense np.bincount array while every id seen is in
+    [0, MAX_DENSE_USER_ID). After the first id outside that range, the
+    counts switch to sorted (ids, counts) arrays merged with np.unique.
+    """
+    dense: Optional[np.ndarray] = np.zeros(0, dtype=np.int64)
+    ids = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+    # show progress while counting users
+    with ProgressBar(prefix="Counting") as pb:
+        for chunk in pd.read_csv(inpath, usecols=[user_col], dtype={user_col: str}, keep_default_na=False, chunksize=CHUNK_ROWS):
+            text = chunk[user_col].to_numpy(dtype=str)
+            uids = pd.to_numeric(text, errors="raise")
+            if uids.dtype != np.int64 or not (uids.astype(str) == text).all():
+                raise ValueError("user ids are not canonical integers")
+            pb.update(len(chunk))
+            if len(uids) == 0:
+                continue
+            if dense is not None and uids.min() >= 0 and uids.max() < MAX_DENSE_USER_ID:
+                chunk_counts = np.bincount(uids, minlength=len(dense))
+                chunk_counts[: len(dense)] += dense
+                dense = chunk_counts
+                continue
+            if dense is not None:
+                ids = np.flatnonzero(dense)
+                counts = dense[ids]
+                dense = None
+            chunk_ids, chunk_counts = np.unique(uids, return_counts=True)
+            ids, inverse = np.unique(np.concatenate([ids, chunk_ids]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([counts, chunk_counts])).astype(np.int64)
+    if dense is not None:
+        ids = np.flatnonzero(dense)
+        counts = dense[ids]
+    return ids, counts
+
+
+def count_users(inpath: str, user_col: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Count ratings per user id, reading only the user column in chunks.
+
+    Returns (ids, counts). The ids are int64 when every id is an integer,
+    otherwise the ids are strings (object array) exactly as written.
+    """
+    try:
+        return _count_int_users(inpath, user_col)
+    except (ValueError, OverflowError):
+        pass
+
+    str_counts: Dict[str, int] = collections.Counter()
+    with ProgressBar(prefix="Counting") as pb:
+        for chunk in pd.read_csv(inpath, usecols=[user_col], dtype={user_col: str}, keep_default_na=False, chunksize=CHUNK_ROWS):
+            str_counts.update(chunk[user_col].value_counts().to_dict())
+            pb.update(len(chunk))
+    return np.array(list(str_counts), dtype=object), np.array(list(str_counts.values()), dtype=np.int64)
+
+
+def _keep_predicate(ids: np.ndarray, counts: np.ndarray, threshold: int) -> Tuple[Callable[[bytes], bool], int]:
+    """Return (test, users_kept); test(field) says whether a raw user field is kept."""
+    keep_ids = ids[counts >= threshold]
+    if ids.dtype.kind != "i":
+        keep_text = {u.encode("utf-8") for u in keep_ids}
+        return keep_text.__contains__, len(keep_text)
+    if len(ids) == 0 or (ids.min() >= 0 and ids.max() < MAX_DENSE_USER_ID):
+        keep_mask = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=bool)
+        keep_mask[keep_ids] = True
+        return lambda field: keep_mask[int(field)], len(keep_ids)
+    keep_set = set(keep_ids.tolist())
+    return lambda field: int(field) in keep_set, len(keep_set)
+
+
+def filter_users_single_pass(inpath: str, outpath: str, user_col: str, threshold: int) -> int:
+    """Filter in one read of the input; output order is not preserved.
+
+    Each user's rows are buffered until the user has `threshold` ratings, at
+    which point the buffer is written out and the user is added to `emit` so
+    later rows skip the buffer. Whatever is still buffered at EOF belongs to
+    users below the threshold and is discarded.
+    """
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
+
     counts: Dict[str, int] = collections.Counter()
-    with open(inpath, newline="", encoding="utf-8") as fh:
-        reader = csv.DictReader(fh)
-        if reader.fieldnames is None:
+    buffer: Dict[str, List[List[str]]] = collections.defaultdict(list)
+    emit: Set[str] = set()
+
+    kept = 0
+    total = 0
+    with open(inpath, newline="", encoding="utf-8") as infh, open(outpath, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as outfh:
+        reader = csv.reader(infh)
+        header = next(reader, None)
+        if header is None:
             raise ValueError("Input CSV has no header")
-        if user_col not in reader.fieldnames:
-            raise ValueError(f"user column '{user_col}' not found in header: {reader.fieldnames}")
-        # show progress while counting users
-        with ProgressBar(prefix="Counting") as pb:
-            for row in wrap_iter(reader, progress=pb):
-                uid = row.get(user_col, "")
+        if user_col not in header:
+            raise ValueError(f"user column '{user_col}' not found in header: {header}")
+        user_idx = header.index(user_col)
+
+        writer = csv.writer(outfh)
+        writer.writerow(header)
+
+        # bound methods hoisted out of the per-row loop
+        writerow = writer.writerow
+        writerows = writer.writerows
+        buffer_pop = buffer.pop
+        emit_add = emit.add
+        with ProgressBar(prefix="Filtering") as pbf:
+            for row in wrap_iter(reader, progress=pbf):
+                if not row:
+                    continue  # blank line
+                total += 1
+                uid = row[user_idx]
+                if uid in emit:
+                    writerow(row)
+                    kept += 1
+                    continue
+                buffer[uid].append(row)
                 counts[uid] += 1
-    return counts
+                if counts[uid] == threshold:
+                    rows = buffer_pop(uid)
+                    writerows(rows)
+                    kept += len(rows)
+                    emit_add(uid)
+
+    print(f"Total rows: {total}; rows kept: {kept}; users kept: {len(emit)}")
+    return kept
+
+
+def _raw_records(infh: BinaryIO) -> Iterator[bytes]:
+    """Yield the CSV records of `infh` as raw bytes, line ending included.
+
+    The file is read READ_CHUNK bytes at a time and split on newlines. A line
+    with an odd number of quotes leaves a quoted field open, so it is joined
+    with the following lines until the quotes balance and the whole record
+    is yielded at once.
+    """
+    residual = b""
+    pending = b""
+    while True:
+        data = infh.read(READ_CHUNK)
+        if not data:
+            break
+        lines = (residual + data).split(b"\n")
+        # the last piece is an incomplete line (or b"" at a newline)
+        residual = lines.pop()
+        for line in lines:
+            if pending:
+                line = pending + line
+                pending = b""
+            if b'"' in line and line.count(b'"') % 2:
+                pending = line + b"\n"
+                continue
+            yield line + b"\n"
+    # a final record without a trailing newline
+    record = pending + residual
+    if b'"' in record and record.count(b'"') % 2:
+        raise ValueError("Input ends inside an unterminated quoted field")
+    if record:
+        yield record
+
+
+def _line_user(line: bytes, user_idx: int) -> Optional[bytes]:
+    """Return the raw user field of a CSV record, or None if the line is blank.
+
+    Only the leading fields up to the user column are split off; csv parsing
+    is used only when the record contains a quote.
+    """
+    line = line.rstrip(b"\n")
+    if not line or line == b"\r":
+        return None
+    if b'"' in line:
+        fields = next(csv.reader(io.StringIO(line.decode("utf-8"), newline="")), [])
+        field = fields[user_idx].encode("utf-8") if len(fields) > user_idx else b""
+    else:
+        fields = line.split(b",", user_idx + 1)
+        # the user column may be the last one, ending in the \r of a CRLF
+        field = fields[user_idx].rstrip(b"\r") if len(fields) > user_idx else b""
+    return field
 
 
 def filter_users(inpath: str, outpath: str, user_col: str, threshold: int, keep_order: bool) -> int:
-    counts = count_users(inpath, user_col)
-    keep_users = {u for u, c in counts.items() if c >= threshold}
+    if not keep_order:
+        return filter_users_single_pass(inpath, outpath, user_col, threshold)
+
+    ids, counts = count_users(inpath, user_col)
+    keep, users_kept = _keep_predicate(ids, counts, threshold)
 
     os.makedirs(os.path.dirname(outpath), exist_ok=True)
 
     kept = 0
     total = 0
-    with open(inpath, newline="", encoding="utf-8") as infh, open(outpath, "w", newline="", encoding="utf-8") as outfh:
-        reader = csv.DictReader(infh)
-        fieldnames = reader.fieldnames or []
-        writer = csv.DictWriter(outfh, fieldnames=fieldnames)
-        writer.writeheader()
+    # Pass 2 never parses whole rows: each record is only split far enough to
+    # reach the user id, and kept records are copied to the output byte for
+    # byte. Records containing a quote fall back to csv parsing.
+    with open(inpath, "rb") as infh, open(outpath, "wb", buffering=WRITE_BUFFER) as outfh:
+        header_line = infh.readline()
+        header = next(csv.reader([header_line.decode("utf-8")]), None)
+        if header is None:
+            raise ValueError("Input CSV has no header")
+        user_idx = header.index(user_col)
+        outfh.write(header_line)
 
+        write = outfh.write
         # Show progress while filtering/writing rows
         with ProgressBar(prefix="Filtering") as pbf:
-            for row in wrap_iter(reader, progress=pbf):
+            for record in wrap_iter(_raw_records(infh), progress=pbf):
+                uid = _line_user(record, user_idx)
+                if uid is None:
+                    continue
                 total += 1
-                if row.get(user_col, "") in keep_users:
-                    writer.writerow(row)
+                if keep(uid):
+                    write(record)
                     kept += 1
 
-    print(f"Total rows: {total}; rows kept: {kept}; users kept: {len(keep_users)}")
+    print(f"Total rows: {total}; rows kept: {kept}; users kept: {users_kept}")
     return kept
 
 
@@ -14,16 +14,26 @@ Usage:
 
 Options:
  - --sort-genres: sort genre columns alphabetically (default: use predefined order)
+ - --workers: split the input into this many newline-aligned byte ranges and
+   encode them in parallel processes (default: 1). Requires that no quoted
+   field contains a newline.
 """
 
 from __future__ import annotations
 
 import argparse
 import csv
+import io
+import mmap
+import multiprocessing
 import os
 import sys
-from typing import List
-from progress import ProgressBar, wrap_iter
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from progress import WRITE_BUFFER
 
 
 # MovieLens predefined genre list. Keep the exact strings so CSV
@@ -51,40 +61,144 @@ GENRE_LIST: List[str] = [
     "(no genres listed)",
 ]
 
+# Placeholder MovieLens uses for movies without any genre.
+NO_GENRES = "(no genres listed)"
+
+
+def encode_genres(genres: pd.Series, genre_list: List[str]) -> np.ndarray:
+    """Return an int8 matrix with one row per entry of `genres`.
+
+    The column is tokenised once on "|" and each token is looked up in a
+    genre -> column index mapping; the matching cells are set in a
+    preallocated array. Tokens not in `genre_list` are ignored. `genres` must
+    have a default RangeIndex so its index doubles as the output row number.
+
+    If a row contains the placeholder genre (compared case-insensitively),
+    that is treated as the only genre present so the corresponding column
+    will be 1 and others 0.
+    """
+    genre_index = {g: i for i, g in enumerate(genre_list)}
+    tokens = genres.str.split("|").explode()
+    cols = tokens.map(genre_index)
+
+    # Nearly every token is already an exact genre name, so only the misses
+    # are stripped and retried rather than normalising every token.
+    miss = cols.isna().to_numpy()
+    if miss.any():
+        tokens[miss] = tokens[miss].str.strip()
+        cols[miss] = tokens[miss].map(genre_index)
+        miss = cols.isna().to_numpy()
+
+    # A placeholder token is either an exact hit on its column or a miss that
+    # matches once lowercased.
+    placeholder = np.zeros(len(tokens), dtype=bool)
+    if NO_GENRES in genre_index:
+        placeholder |= (cols == genre_index[NO_GENRES]).to_numpy()
+    if miss.any():
+        placeholder[miss] = (tokens[miss].str.lower() == NO_GENRES).to_numpy()
+
+    rows = tokens.index.to_numpy()
+    hit = ~cols.isna().to_numpy()
+
+    flags = np.zeros((len(genres), len(genre_list)), dtype=np.int8)
+    flags[rows[hit], cols.to_numpy()[hit].astype(np.intp)] = 1
+    if placeholder.any():
+        no_genre_rows = rows[placeholder]
+        flags[no_genre_rows] = 0
+        if NO_GENRES in genre_index:
+            flags[no_genre_rows, genre_index[NO_GENRES]] = 1
+    return flags
+
+
+def _encode_frame(movies: pd.DataFrame, genre_list: List[str]) -> pd.DataFrame:
+    """Replace the `genres` column of `movies` with one int8 column per genre."""
+    onehot = pd.DataFrame(encode_genres(movies["genres"], genre_list), columns=genre_list)
+    return pd.concat([movies.drop(columns="genres"), onehot], axis=1)
+
 
 def write_onehot(input_path: str, output_path: str, genre_list: List[str]) -> int:
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    with open(input_path, newline="", encoding="utf-8") as infh, \
-         open(output_path, "w", newline="", encoding="utf-8") as outfh:
-        reader = csv.DictReader(infh)
-        if not reader.fieldnames:
-            raise ValueError("Input CSV has no header")
-
-        other_fields = [f for f in reader.fieldnames if f != "genres"]
-        fieldnames = other_fields + genre_list
-        writer = csv.DictWriter(outfh, fieldnames=fieldnames)
-        writer.writeheader()
-
-        row_count = 0
-        # Show progress while processing rows
-        with ProgressBar(prefix="Processing") as pb:
-            for row in wrap_iter(reader, progress=pb):
-                out_row = {k: row.get(k, "") for k in other_fields}
-                raw = row.get("genres", "")
-                present = set(g.strip() for g in raw.split("|") if g.strip())
-                # If the dataset explicitly uses the placeholder, treat that as the
-                # only genre present so the corresponding column will be 1 and
-                # others 0. Otherwise keep the parsed genres as-is.
-                lowered = {g.lower() for g in present}
-                if "(no genres listed)" in lowered:
-                    present = {"(no genres listed)"}
-
-                for g in genre_list:
-                    out_row[g] = "1" if g in present else "0"
-
-                writer.writerow(out_row)
-                row_count += 1
+    # Read everything as text so the non-genre columns are written back
+    # exactly as they appear in the input.
+    movies = pd.read_csv(input_path, dtype=str, keep_default_na=False)
+    if "genres" not in movies.columns:
+        raise ValueError(f"Input CSV has no 'genres' column: {list(movies.columns)}")
+
+    out = _encode_frame(movies, genre_list)
+    with open(output_path, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as outfh:
+        out.to_csv(outfh, index=False, lineterminator="\r\n")
+
+    return len(out)
+
+
+def _split_offsets(mm: mmap.mmap, start: int, parts: int) -> List[int]:
+    """Return sorted byte offsets cutting mm[start:] into up to `parts` ranges.
+
+    Every cut is moved forward to just past the next newline so no row is
+    split between two ranges.
+    """
+    size = len(mm)
+    offsets = [start]
+    for k in range(1, parts):
+        target = max(start + (size - start) * k // parts, offsets[-1])
+        nl = mm.find(b"\n", target)
+        if nl == -1:
+            break
+        if nl + 1 > offsets[-1]:
+            offsets.append(nl + 1)
+    if size > offsets[-1]:
+        offsets.append(size)
+    return offsets
+
+
+def _encode_range(task: Tuple[str, int, int, List[str], List[str]]) -> Tuple[bytes, int]:
+    """Worker: one-hot encode the rows in bytes [lo, hi) of the input.
+
+    Returns the encoded rows as CSV bytes (no header) and the row count.
+    """
+    input_path, lo, hi, columns, genre_list = task
+    with open(input_path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[lo:hi]
+    movies = pd.read_csv(io.BytesIO(data), header=None, names=columns, dtype=str, keep_default_na=False)
+    out = _encode_frame(movies, genre_list)
+    return out.to_csv(index=False, header=False, lineterminator="\r\n").encode("utf-8"), len(out)
+
+
+def write_onehot_parallel(input_path: str, output_path: str, genre_list: List[str], workers: int) -> int:
+    """Like write_onehot, but encode byte ranges of the input in `workers` processes.
+
+    The input is memory-mapped and cut on newlines, so it must not contain
+    newlines inside quoted fields (MovieLens movies.csv does not). Each worker
+    parses and encodes its range; the results are written in input order.
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # mmap refuses empty files, so check for a header up front.
+    if os.path.getsize(input_path) == 0:
+        raise ValueError("Input CSV has no header")
+
+    with open(input_path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # A header-only file may have no trailing newline.
+        header_end = mm.find(b"\n") + 1 or len(mm)
+        columns = next(csv.reader([mm[:header_end].decode("utf-8")]))
+        offsets = _split_offsets(mm, header_end, workers)
+
+    if "genres" not in columns:
+        raise ValueError(f"Input CSV has no 'genres' column: {columns}")
+
+    tasks = [(input_path, lo, hi, columns, genre_list) for lo, hi in zip(offsets, offsets[1:])]
+
+    row_count = 0
+    with open(output_path, "wb", buffering=WRITE_BUFFER) as outfh:
+        header = io.StringIO()
+        csv.writer(header).writerow([c for c in columns if c != "genres"] + genre_list)
+        outfh.write(header.getvalue().encode("utf-8"))
+        with multiprocessing.Pool(min(workers, max(len(tasks), 1))) as pool:
+            # imap keeps the results in task order, i.e. input order.
+            for data, n in pool.imap(_encode_range, tasks):
+                outfh.write(data)
+                row_count += n
 
     return row_count
 
@@ -94,6 +208,7 @@ def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
     p.add_argument("--input", required=True, help="Path to raw movies.csv")
     p.add_argument("--output", required=True, help="Path to write processed CSV")
     p.add_argument("--sort-genres", action="store_true", help="Sort genre columns alphabetically")
+    p.add_argument("--workers", type=int, default=1, help="Number of processes encoding byte ranges of the input in parallel (default: 1)")
     return p.parse_args(argv)
 
 
@@ -113,8 +228,15 @@ def main(argv: List[str] | None = None) -> int:
     else:
         genre_list = GENRE_LIST
 
+    if args.workers < 1:
+        print("--workers must be >= 1", file=sys.stderr)
+        return 2
+
     print(f"Using {len(genre_list)} genres")
-    written = write_onehot(input_path, output_path, genre_list)
+    if args.workers > 1:
+        written = write_onehot_parallel(input_path, output_path, genre_list, args.workers)
+    else:
+        written = write_onehot(input_path, output_path, genre_list)
     print(f"Wrote {written} rows to {output_path}")
     return 0
 
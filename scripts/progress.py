@@ -5,8 +5,8 @@ helper `wrap_iter` generator to wrap existing iterables so scripts can show
 progress without pulling in external packages.
 
 API
-- ProgressBar(total=None, prefix='', length=40, file=sys.stderr)
-    - .update(n=1): advance by n and redraw
+- ProgressBar(total=None, prefix='', length=40, file=sys.stderr, draw_every=16384)
+    - .update(n=1): advance by n; redraws once every `draw_every` items
     - .set_total(total): set or change total
     - .finish(): draw final bar and newline
     - context-manager support (with ProgressBar(...) as pb:)
@@ -14,6 +14,8 @@ API
 - wrap_iter(iterable, **progress_kwargs)
     - yields items from iterable and updates the bar on each iteration
 
+- WRITE_BUFFER: buffer size the scripts pass to open() for their outputs
+
 Example:
 
     from scripts.progress import ProgressBar, wrap_iter
@@ -36,6 +38,10 @@ import sys
 import time
 from typing import Iterable, Iterator, Optional
 
+# Output files are written through a 1 MiB buffer so the per-row writes
+# batch into few large write() calls.
+WRITE_BUFFER = 1 << 20
+
 
 class ProgressBar:
     """A minimal terminal progress bar.
@@ -43,15 +49,21 @@ class ProgressBar:
     It writes to the provided file (defaults to stderr) and redraws the same
     line using carriage return. If total is None, it shows a counter instead
     of percentage.
+
+    To keep update() cheap in tight loops, the bar is only redrawn (and the
+    clock only read) once every `draw_every` items; finish() always draws the
+    exact final state.
     """
 
-    def __init__(self, total: Optional[int] = None, prefix: str = "", length: int = 40, file=None):
+    def __init__(self, total: Optional[int] = None, prefix: str = "", length: int = 40, file=None, draw_every: int = 1 << 14):
         self.total = total
         self.prefix = prefix
         self.length = length
         self.file = file or sys.stderr
+        self.draw_every = draw_every
         self.start = time.time()
         self.count = 0
+        self._next_draw = draw_every
         self._last_drawn = ""
 
     def set_total(self, total: Optional[int]) -> None:
@@ -59,18 +71,27 @@ class ProgressBar:
 
     def update(self, n: int = 1) -> None:
         self.count += n
+        if self.count < self._next_draw:
+            return
+        # Step past the current count so a large n doesn't trigger a redraw
+        # on every following call.
+        self._next_draw = self.count - self.count % self.draw_every + self.draw_every
         self._draw()
 
     def _draw(self) -> None:
         elapsed = time.time() - self.start
-        if self.total:
-            frac = min(float(self.count) / float(self.total), 1.0)
-            filled_len = int(round(self.length * frac))
-            bar = "█" * filled_len + "-" * (self.length - filled_len)
+        count = self.count
+        total = self.total
+        prefix = self.prefix
+        if total:
+            length = self.length
+            frac = min(float(count) / float(total), 1.0)
+            filled_len = int(round(length * frac))
+            bar = "█" * filled_len + "-" * (length - filled_len)
             pct = int(frac * 100)
-            s = f"{self.prefix} |{bar}| {pct:3d}% ({self.count}/{self.total}) Elapsed: {int(elapsed)}s"
+            s = f"{prefix} |{bar}| {pct:3d}% ({count}/{total}) Elapsed: {int(elapsed)}s"
         else:
-            s = f"{self.prefix} {self.count} items Elapsed: {int(elapsed)}s"
+            s = f"{prefix} {count} items Elapsed: {int(elapsed)}s"
 
         # Only rewrite if changed to reduce terminal noise
         if s != self._last_drawn:
@@ -93,6 +114,7 @@ class ProgressBar:
     def __enter__(self) -> "ProgressBar":
         self.start = time.time()
         self.count = 0
+        self._next_draw = self.draw_every
         self._last_drawn = ""
         return self
 
@@ -112,10 +134,11 @@ def wrap_iter(iterable: Iterable, progress: Optional[ProgressBar] = None, total:
         pb = ProgressBar(total=total, prefix=prefix)
         own = True
 
+    update = pb.update
     try:
         for item in iterable:
             yield item
-            pb.update(1)
+            update(1)
     finally:
         if own:
             pb.finish()